@@ -4,78 +4,172 @@ import datetime as _dt
 import io
 import uuid
 
+import numpy as np
 import pandas as pd
 import yfinance as yf
 import matplotlib.pyplot as plt
+from PIL import Image
 from email.mime.image import MIMEImage
 
-def performance_charts(symbols: list[str]) -> dict[str, tuple[str, MIMEImage]]:
-    """
-    Returns two inline charts (1M and 1Y) as { "1M": (cid, MIMEImage), "1Y": (cid, MIMEImage) }.
-    Each plot shows cumulative % returns from day 0, with weekend/holiday gaps forward-filled.
-    """
-    if not symbols:
-        raise ValueError("Must provide at least one symbol")
+# Chart horizons; None means the full available history
+SPANS = {
+    "1M":  _dt.timedelta(days=30),
+    "3M":  _dt.timedelta(days=91),
+    "6M":  _dt.timedelta(days=182),
+    "1Y":  _dt.timedelta(days=365),
+    "5Y":  _dt.timedelta(days=5 * 365),
+    "10Y": _dt.timedelta(days=10 * 365),
+    "MAX": None,
+}
+DEFAULT_SPANS = ("1M", "1Y")
 
-    end = _dt.date.today()
-    spans = {
-        "1M": _dt.timedelta(days=30),
-        "1Y": _dt.timedelta(days=365),
-    }
-    out: dict[str, tuple[str, MIMEImage]] = {}
+# Points drawn per line; longer spans are downsampled to this with LTTB
+MAX_POINTS = 250
+
+# Palette size for quantized PNGs; line charts use only a handful of colors
+PNG_COLORS = 64
 
-    for label, delta in spans.items():
-        start = end - delta
 
-        # 1) Download just the Close prices
+def _cumulative_returns(symbols: list[str], label: str, delta: _dt.timedelta | None) -> pd.DataFrame:
+    """
+    Download Close prices for `symbols` over the last `delta` (all history if None)
+    and return cumulative % returns from day 0, with weekend/holiday gaps forward-filled.
+    """
+    # 1) Download just the Close prices
+    if delta is None:
+        df = yf.download(symbols, period="max", progress=False)["Close"]
+    else:
+        end = _dt.date.today()
         df = yf.download(
             symbols,
-            start=start,
+            start=end - delta,
             end=end,
             progress=False
         )["Close"]
 
-        # 2) Ensure DataFrame (single‐symbol download yields a Series)
-        if not hasattr(df, "columns"):
-            df = df.to_frame(name=symbols[0])
+    # 2) Ensure DataFrame (single‐symbol download yields a Series)
+    if not hasattr(df, "columns"):
+        df = df.to_frame(name=symbols[0])
+
+    # 3) Build a uniform business‐day index and forward-fill missing days
+    bdays = pd.date_range(start=df.index.min(), end=df.index.max(), freq="B")
+    df = df.reindex(bdays).ffill()
+
+    # 4) Drop rows where *all* symbols are still NaN
+    df = df.dropna(how="all")
+    if df.empty:
+        raise ValueError(f"No price data available for {label} window")
+
+    # 5) Compute cumulative % return from each symbol's first available close
+    #    (over long spans some symbols start trading later than others)
+    return (df / df.bfill().iloc[0] - 1) * 100
+
+
+def _lttb(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `n` points that preserve the
+    visual shape of (x, y). Keeps the first and last point; from each bucket
+    in between picks the point forming the largest triangle with the previous
+    pick and the next bucket's average.
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+
+    x = x.astype(float) - float(x[0])
+    y = y.astype(float)
+    edges = np.linspace(1, size - 1, n - 1).astype(int)
+    out = np.empty(n, dtype=int)
+    out[0], out[-1] = 0, size - 1
+
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (size - 1, size)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
 
-        # 3) Build a uniform business‐day index and forward-fill missing days
-        bdays = pd.date_range(start=df.index.min(), end=df.index.max(), freq="B")
-        df = df.reindex(bdays).ffill()
 
-        # 4) Drop rows where *all* symbols are still NaN
-        df = df.dropna(how="all")
-        if df.empty:
-            raise ValueError(f"No price data available for {label} window")
+def _plot_returns(ax, cum_pct: pd.DataFrame, label: str, max_points: int = MAX_POINTS) -> None:
+    for col in cum_pct.columns:
+        line = cum_pct[col].dropna()
+        keep = _lttb(line.index.values.astype("int64"), line.to_numpy(), max_points)
+        ax.plot(line.index[keep], line.iloc[keep], label=col)
+    ax.set_title(f"{label} Performance", fontsize=12, pad=8)
+    ax.set_ylabel("% Return", fontsize=10)
+    ax.legend(fontsize=8, loc="upper left")
+    ax.grid(alpha=0.3)
 
-        # 5) Compute cumulative % return from first row
-        cum_pct = (df / df.iloc[0] - 1) * 100
 
-        # 6) Plot into a standalone figure
+def _png_bytes(fig, colors: int = PNG_COLORS) -> bytes:
+    """
+    Render `fig` to PNG, then re-encode it with an adaptive palette of
+    `colors` entries and zlib optimization. Palette PNGs of line charts
+    are typically a fraction of the size of the 24-bit original.
+    """
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=120)
+    plt.close(fig)
+    buf.seek(0)
+
+    with Image.open(buf) as im:
+        pal = im.convert("RGB").quantize(colors=colors)
+    out = io.BytesIO()
+    pal.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def _inline_image(png_bytes: bytes, label: str) -> tuple[str, MIMEImage]:
+    cid = f"perf_{label.lower()}_{uuid.uuid4().hex}@digest"
+    img = MIMEImage(png_bytes, _subtype="png")
+    img.add_header("Content-ID", f"<{cid}>")
+    img.add_header("Content-Disposition", "inline")
+    return cid, img
+
+
+def performance_charts(symbols: list[str], spans=DEFAULT_SPANS, combined: bool = False,
+                       max_points: int = MAX_POINTS) -> dict[str, tuple[str, MIMEImage]]:
+    """
+    Returns one inline chart per span label (keys of SPANS, default 1M and 1Y)
+    as { "1M": (cid, MIMEImage), "1Y": (cid, MIMEImage) }.
+    Each plot shows cumulative % returns from day 0, with weekend/holiday gaps forward-filled.
+    Every line is downsampled to at most `max_points` points, so render time and
+    PNG size don't grow with the span length.
+    With combined=True all spans are stacked into one image, returned as { "combined": (cid, MIMEImage) },
+    which saves a MIME part and the repeated PNG headers/axes chrome.
+    """
+    if not symbols:
+        raise ValueError("Must provide at least one symbol")
+    unknown = [s for s in spans if s not in SPANS]
+    if unknown:
+        raise ValueError(f"Unknown chart span(s): {', '.join(unknown)}")
+
+    returns = {
+        label: _cumulative_returns(symbols, label, SPANS[label])
+        for label in spans
+    }
+
+    if combined:
+        fig, axes = plt.subplots(len(returns), 1, figsize=(6, 3 * len(returns)), dpi=120, squeeze=False)
+        for ax, (label, cum_pct) in zip(axes[:, 0], returns.items()):
+            _plot_returns(ax, cum_pct, label, max_points)
+            # autofmt_xdate would hide the upper axis' dates; spans differ, so rotate each
+            ax.tick_params(axis="x", labelrotation=30)
+        plt.tight_layout()
+        return {"combined": _inline_image(_png_bytes(fig), "combined")}
+
+    out: dict[str, tuple[str, MIMEImage]] = {}
+    for label, cum_pct in returns.items():
         fig, ax = plt.subplots(figsize=(6, 3), dpi=120)
-        for col in cum_pct.columns:
-            ax.plot(cum_pct.index, cum_pct[col], label=col)
-        ax.set_title(f"{label} Performance", fontsize=12, pad=8)
-        ax.set_ylabel("% Return", fontsize=10)
-        ax.legend(fontsize=8, loc="upper left")
-        ax.grid(alpha=0.3)
+        _plot_returns(ax, cum_pct, label, max_points)
         fig.autofmt_xdate()
         plt.tight_layout()
-
-        # 7) Serialize to PNG in memory
-        buf = io.BytesIO()
-        fig.savefig(buf, format="png", dpi=120)
-        plt.close(fig)
-        buf.seek(0)
-        png_bytes = buf.read()
-        buf.close()
-
-        # 8) Wrap as inline MIMEImage with a unique CID
-        cid = f"perf_{label.lower()}_{uuid.uuid4().hex}@digest"
-        img = MIMEImage(png_bytes, _subtype="png")
-        img.add_header("Content-ID", f"<{cid}>")
-        img.add_header("Content-Disposition", "inline")
-
-        out[label] = (cid, img)
+        out[label] = _inline_image(_png_bytes(fig), label)
 
     return out
@@ -2,6 +2,8 @@
 
 import os
 import smtplib
+import email.policy
+from contextlib          import contextmanager
 from email.mime.text     import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image    import MIMEImage
@@ -17,7 +19,33 @@ SMTP_USERNAME = os.getenv("SMTP_USERNAME") or st.secrets["SMTP_USERNAME"]
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD") or st.secrets["SMTP_PASSWORD"]
 
 
-def send_email(recipient: str, subject: str, html_body: str, inline_images=None):
+def message_size_report(msg: MIMEMultipart, wire: bytes) -> dict:
+    """
+    Byte sizes of a built message as it goes over the wire:
+    per-part encoded payloads plus `wire`, the serialized message actually sent.
+    """
+    report = {"html": 0, "plain": 0, "images": 0, "image_count": 0}
+    for part in msg.walk():
+        if part.is_multipart():
+            continue
+        size = len(part.get_payload().encode("ascii", "replace"))
+        ctype = part.get_content_type()
+        if ctype == "text/html":
+            report["html"] += size
+        elif ctype == "text/plain":
+            report["plain"] += size
+        elif part.get_content_maintype() == "image":
+            report["images"] += size
+            report["image_count"] += 1
+    report["total"] = len(wire)
+    return report
+
+
+def build_message(recipient: str, subject: str, html_body: str, inline_images=None) -> MIMEMultipart:
+    """
+    Assemble the digest MIME message (HTML + plain-text fallback + inline images)
+    without sending it.
+    """
     msg = MIMEMultipart("related")
     msg["From"]            = f"Finance News <{SMTP_SENDER}>"
     msg["To"]              = recipient
@@ -26,7 +54,11 @@ def send_email(recipient: str, subject: str, html_body: str, inline_images=None)
     msg["List-Unsubscribe"]= f"<mailto:{SMTP_SENDER}?subject=Unsubscribe>"
 
     # Fallback to plain text
-    plain = BeautifulSoup(html_body, "html.parser").get_text()
+    # (drop <style> blocks so hoisted CSS doesn't leak into the text)
+    soup = BeautifulSoup(html_body, "html.parser")
+    for tag in soup(["style"]):
+        tag.decompose()
+    plain = soup.get_text()
     alt   = MIMEMultipart("alternative")
     alt.attach(MIMEText(plain, "plain"))
     alt.attach(MIMEText(html_body, "html"))
@@ -37,7 +69,42 @@ def send_email(recipient: str, subject: str, html_body: str, inline_images=None)
         for img in inline_images:
             msg.attach(img)
 
+    return msg
+
+
+def wire_bytes(msg: MIMEMultipart) -> bytes:
+    """
+    Serialize for SMTP with CRLF line endings. smtplib only fixes line
+    endings for str input, and servers reject or rewrite bare LF.
+    """
+    return msg.as_bytes(policy=email.policy.SMTP)
+
+
+@contextmanager
+def smtp_connection():
+    """
+    Logged-in SMTP session; reuse one across many sends to skip the
+    per-message TCP/TLS/AUTH handshake.
+    """
     with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
         server.starttls()
         server.login(SMTP_USERNAME, SMTP_PASSWORD)
-        server.sendmail(SMTP_SENDER, [recipient], msg.as_string())
+        yield server
+
+
+def send_raw(server: smtplib.SMTP, recipient: str, raw: bytes):
+    server.sendmail(SMTP_SENDER, [recipient], raw)
+
+
+def send_email(recipient: str, subject: str, html_body: str, inline_images=None) -> dict:
+    """
+    Send the digest and return its size report (see message_size_report).
+    """
+    msg = build_message(recipient, subject, html_body, inline_images)
+    wire = wire_bytes(msg)
+    report = message_size_report(msg, wire)
+
+    with smtp_connection() as server:
+        send_raw(server, recipient, wire)
+
+    return report
@@ -0,0 +1,123 @@
+# html_optimizer.py
+
+import re
+from collections import Counter
+
+# Matches style='...' or style="..." attributes on any tag
+STYLE_ATTR_RE = re.compile(r"""\sstyle=(['"])(.*?)\1""", re.S)
+CLASS_ATTR_RE = re.compile(r"""\sclass=(['"])(.*?)\1""", re.S)
+# Any start tag
+START_TAG_RE = re.compile(r"<[a-zA-Z][^<>]*>")
+# Whitespace between two tags, e.g. "</p>\n   <p>"; groups capture both tag names
+INTER_TAG_WS_RE = re.compile(r"(</?([a-zA-Z][a-zA-Z0-9]*)[^<>]*>)\s+(?=</?([a-zA-Z][a-zA-Z0-9]*))")
+# Whitespace next to these tags never renders, so it can be dropped outright
+BLOCK_TAGS = {
+    "html", "head", "body", "style", "div", "p", "h1", "h2", "h3", "h4", "h5", "h6",
+    "ul", "ol", "li", "table", "thead", "tbody", "tfoot", "tr", "th", "td", "br", "hr",
+}
+# Runs of whitespace inside text nodes
+WS_RUN_RE = re.compile(r"\s{2,}")
+
+# A style must repeat at least this often before it is hoisted into a class
+MIN_STYLE_REPEATS = 3
+
+
+def _split_declarations(style: str) -> list[str]:
+    """
+    Split a style on ';' outside quotes and parentheses, so values like
+    url(data:image/png;base64,...) or "Foo;Bar" stay whole.
+    """
+    decls, start, depth, quote = [], 0, 0, None
+    for i, ch in enumerate(style):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth = max(depth - 1, 0)
+        elif ch == ";" and depth == 0:
+            decls.append(style[start:i])
+            start = i + 1
+    decls.append(style[start:])
+    return decls
+
+
+def _normalize_style(style: str) -> str:
+    """
+    Canonical form of an inline style: no whitespace around ':' / ';',
+    no empty declarations, no trailing ';'.
+    """
+    decls = []
+    for decl in _split_declarations(style):
+        if ":" not in decl:
+            continue
+        prop, value = decl.split(":", 1)
+        prop, value = prop.strip().lower(), " ".join(value.split())
+        if prop and value:
+            decls.append(f"{prop}:{value}")
+    return ";".join(decls)
+
+
+def dedupe_inline_styles(html: str, min_repeats: int = MIN_STYLE_REPEATS) -> tuple[str, str]:
+    """
+    Replace inline styles that repeat at least `min_repeats` times with short
+    class names. Returns (html, css) where css holds the hoisted rules.
+    Styles that only occur a few times stay inline, so one-off elements
+    keep rendering even in clients that ignore <style> blocks.
+    """
+    counts = Counter(_normalize_style(m.group(2)) for m in STYLE_ATTR_RE.finditer(html))
+    repeated = [style for style, n in counts.most_common() if style and n >= min_repeats]
+    hoisted = {style: f"s{i}" for i, style in enumerate(repeated)}
+
+    def _restyle(tag: str) -> str:
+        m = STYLE_ATTR_RE.search(tag)
+        if not m:
+            return tag
+        style = _normalize_style(m.group(2))
+        rest = tag[:m.start()] + tag[m.end():]
+        if not style:
+            return rest
+        if style not in hoisted:
+            quote = '"' if "'" in style else "'"
+            return f"{tag[:m.start()]} style={quote}{style}{quote}{tag[m.end():]}"
+        # Merge into an existing class attribute rather than adding a second one
+        cls = CLASS_ATTR_RE.search(rest)
+        if cls:
+            q, value = cls.group(1), f"{cls.group(2)} {hoisted[style]}".strip()
+            return f"{rest[:cls.start()]} class={q}{value}{q}{rest[cls.end():]}"
+        return f"{rest[:m.start()]} class='{hoisted[style]}'{rest[m.start():]}"
+
+    html = START_TAG_RE.sub(lambda m: _restyle(m.group(0)), html)
+    css = "".join(f".{cls}{{{style}}}" for style, cls in hoisted.items())
+    return html, css
+
+
+def minify_html(html: str) -> str:
+    """
+    Drop whitespace between tags where one side is block-level, shrink it to
+    a single space between inline elements, and collapse whitespace runs in
+    text. The digest never uses <pre>, whose whitespace this would change.
+    """
+    def _between(m: re.Match) -> str:
+        left, right = m.group(2).lower(), m.group(3).lower()
+        # Between inline elements (e.g. "</strong> <em>") the space is visible text
+        gap = "" if left in BLOCK_TAGS or right in BLOCK_TAGS else " "
+        return m.group(1) + gap
+
+    html = INTER_TAG_WS_RE.sub(_between, html)
+    html = WS_RUN_RE.sub(" ", html)
+    return html.strip()
+
+
+def optimize_html(html: str) -> str:
+    """
+    Shrink the digest HTML before it is attached to the email:
+    repeated inline styles become classes in a <head> <style> block,
+    remaining styles are normalized and whitespace is minified.
+    """
+    html, css = dedupe_inline_styles(html)
+    head = f"<head><style>{css}</style></head>" if css else ""
+    return minify_html(f"<html>{head}<body>{html}</body></html>")
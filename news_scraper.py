@@ -2,11 +2,16 @@
 
 import os
 import datetime as dt
+import sqlite3
+import time
 import requests
 import re
+from urllib.parse import urlparse
 
 import streamlit as st
 
+from news_store import NewsStore
+
 # Load API keys from env OR Streamlit secrets
 NEWS_KEY    = os.getenv("NEWS_API_KEY", "").strip() or st.secrets["NEWS_API_KEY"]
 FINNHUB_KEY = os.getenv("FINNHUB_API_KEY", "").strip() or st.secrets["FINNHUB_API_KEY"]
@@ -20,8 +25,24 @@ HQ_DOMAINS = [
 ]
 TICKER_RE = re.compile(r"^[A-Z0-9\.\-]{1,6}$")
 
+# A query answered from the local store is topped up at most this often
+REFRESH_SECONDS = 15 * 60
+# NewsAPI's maximum page size
+INGEST_PAGE_SIZE = 100
+# Pages walked back per source and refresh. Past this many newer articles, older
+# ones would never rank into a digest's handful of headlines, so they're skipped.
+INGEST_MAX_PAGES = 5
+
+# Ranking tiers in the local store (lower sorts first)
+TIER_HQ, TIER_NEWSAPI, TIER_FINNHUB = 0, 1, 2
+
+_store: NewsStore | None = None
+_store_failed = False
+
 
-def _fetch_newsapi(symbol: str, company: str, max_items: int, domains: str | None) -> list[dict]:
+def _fetch_newsapi(symbol: str, company: str, max_items: int, domains: str | None,
+                   since: str | None = None, until: str | None = None,
+                   raise_errors: bool = False) -> list[dict]:
     if not NEWS_KEY:
         return []
     params = {
@@ -33,30 +54,38 @@ def _fetch_newsapi(symbol: str, company: str, max_items: int, domains: str | Non
     }
     if domains:
         params["domains"] = domains
+    if since:
+        params["from"] = since
+    if until:
+        params["to"] = until
 
     try:
         r = requests.get("https://newsapi.org/v2/everything", params=params, timeout=5)
         r.raise_for_status()
+        articles = r.json().get("articles", []) or []
     except Exception:
+        if raise_errors:
+            raise
         return []
 
-    articles = r.json().get("articles", []) or []
     return [
         {
             "title":  a.get("title",     "No headline"),
             "url":    a.get("url",       ""),
-            "source": a.get("source", {}).get("name", "")
+            "source": a.get("source", {}).get("name", ""),
+            "published_at": a.get("publishedAt", ""),
         }
         for a in articles[:max_items]
     ]
 
 
-def _fetch_finnhub(symbol: str, days: int, max_items: int) -> list[dict]:
+def _fetch_finnhub(symbol: str, days: int, max_items: int | None, since: str | None = None,
+                   raise_errors: bool = False) -> list[dict]:
     if not FINNHUB_KEY:
         return []
 
     today = dt.date.today()
-    frm   = today - dt.timedelta(days=days)
+    frm   = dt.date.fromisoformat(since[:10]) if since else today - dt.timedelta(days=days)
     params = {
         "symbol": symbol,
         "from":   frm.isoformat(),
@@ -67,19 +96,140 @@ def _fetch_finnhub(symbol: str, days: int, max_items: int) -> list[dict]:
     try:
         r = requests.get(FINNHUB_URL, params=params, timeout=5)
         r.raise_for_status()
+        data = r.json() or []
     except Exception:
+        if raise_errors:
+            raise
         return []
 
-    data = r.json() or []
     return [
         {"title": it.get("headline","No headline"),
          "url":   it.get("url",""),
-         "source":it.get("source","Finnhub")}
+         "source":it.get("source","Finnhub"),
+         "published_at": dt.datetime.fromtimestamp(it.get("datetime", 0), dt.timezone.utc)
+                           .strftime("%Y-%m-%dT%H:%M:%SZ")}
         for it in data[:max_items]
     ]
 
 
+def _is_hq(url: str) -> bool:
+    host = urlparse(url).netloc.lower()
+    return any(host == d or host.endswith("." + d) for d in HQ_DOMAINS)
+
+
+def _get_store() -> NewsStore | None:
+    """Shared local store, or None if it can't be opened (e.g. SQLite without FTS5)."""
+    global _store, _store_failed
+    if _store is None and not _store_failed:
+        try:
+            _store = NewsStore()
+        except sqlite3.Error:
+            _store_failed = True
+    return _store
+
+
+def _fetch_newsapi_since(symbol: str, company: str, domains: str | None, since: str | None) -> list[dict]:
+    """
+    Every article newer than `since`. NewsAPI only sorts newest-first and the
+    free plan serves one page per query, so this walks back in time with the
+    `to` bound (set to the oldest article seen) until a short page shows the
+    watermark was reached, or INGEST_MAX_PAGES pages were read. Raises on
+    any failed request.
+    """
+    arts, until = [], None
+    for _ in range(INGEST_MAX_PAGES):
+        page = _fetch_newsapi(symbol, company, INGEST_PAGE_SIZE, domains,
+                              since=since, until=until, raise_errors=True)
+        arts += page
+        if len(page) < INGEST_PAGE_SIZE:
+            break
+        oldest = min((a["published_at"] for a in page if a["published_at"]), default=until)
+        if oldest is None or oldest == until:
+            # A full page sharing one timestamp; `to` can't step past it
+            break
+        until = oldest
+    return arts
+
+
+def _ingest_source(store: NewsStore, symbol: str, company: str, source: str, fetch, tier,
+                   refresh_after: float) -> int:
+    """
+    Top up one source for one query from that source's own watermark.
+    A fetch that raises leaves the watermark and its check time untouched,
+    so the missed window is asked for again next time.
+    """
+    wm = store.watermark(symbol, company, source)
+    if wm is not None and time.time() - wm[1] < refresh_after:
+        return 0
+    try:
+        arts = fetch(wm[0] if wm else None)
+    except Exception:
+        return 0
+    for a in arts:
+        a["tier"] = tier(a)
+    added = store.add(arts, tag=symbol)
+    latest = max((a["published_at"] for a in arts if a["published_at"]), default=None)
+    store.set_watermark(symbol, company, source, latest)
+    return added
+
+
+def ingest_query(store: NewsStore, symbol: str, company: str, refresh_after: float = 0) -> int:
+    """
+    Pull articles for one query published since each source's watermark into
+    the store, skipping sources checked within `refresh_after` seconds.
+    Like the live path, NewsAPI is asked once restricted to HQ_DOMAINS and
+    once across all domains; Finnhub is added for tickers.
+    Returns the number of new articles.
+    """
+    added = _ingest_source(
+        store, symbol, company, "newsapi_hq",
+        lambda since: _fetch_newsapi_since(symbol, company, ",".join(HQ_DOMAINS), since),
+        lambda a: TIER_HQ,
+        refresh_after,
+    )
+    added += _ingest_source(
+        store, symbol, company, "newsapi",
+        lambda since: _fetch_newsapi_since(symbol, company, None, since),
+        lambda a: TIER_HQ if _is_hq(a["url"]) else TIER_NEWSAPI,
+        refresh_after,
+    )
+    if TICKER_RE.fullmatch(symbol):
+        added += _ingest_source(
+            store, symbol, company, "finnhub",
+            # company-news returns the whole date range in one response; keep all of it
+            lambda since: _fetch_finnhub(symbol, days=7, max_items=None,
+                                         since=since, raise_errors=True),
+            lambda a: TIER_FINNHUB,
+            refresh_after,
+        )
+    return added
+
+
+def refresh_all(store: NewsStore) -> int:
+    """Top up every recently requested query; meant to run on a schedule."""
+    return sum(ingest_query(store, sym, comp) for sym, comp in store.queries())
+
+
 def get_news_for_symbol(symbol: str, company: str, max_items: int = 5) -> list[dict]:
+    """
+    Latest headlines matching `symbol` or `company`, high-quality domains first.
+    Answered from the local news store, which is topped up from the APIs
+    when this query's last fetch is older than REFRESH_SECONDS; if the store
+    is unavailable or errors (locked, disk), falls back to live API calls.
+    """
+    store = _get_store()
+    if store is None:
+        return _get_news_live(symbol, company, max_items)
+
+    try:
+        store.touch(symbol, company)
+        ingest_query(store, symbol, company, refresh_after=REFRESH_SECONDS)
+        return store.search(symbol, company, max_items)
+    except sqlite3.Error:
+        return _get_news_live(symbol, company, max_items)
+
+
+def _get_news_live(symbol: str, company: str, max_items: int = 5) -> list[dict]:
     # 1) HQ domains
     hq = _fetch_newsapi(symbol, company, max_items, domains=",".join(HQ_DOMAINS))
     if len(hq) >= max_items:
@@ -98,3 +248,13 @@ def get_news_for_symbol(symbol: str, company: str, max_items: int = 5) -> list[d
         combined.extend(fb)
 
     return combined[:max_items]
+
+
+if __name__ == "__main__":
+    # Scheduled ingestion job: keep recently requested queries warm and drop stale rows.
+    # "world" is in every digest, so it stays active (refresh_all fetches it once).
+    store = NewsStore()
+    store.touch("world", "global economy")
+    added = refresh_all(store)
+    pruned = store.prune()
+    print(f"added {added} article(s), pruned {pruned}")
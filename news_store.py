@@ -0,0 +1,195 @@
+# news_store.py
+
+import datetime as dt
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+
+NEWS_STORE_PATH = os.getenv("NEWS_STORE_PATH", "news_store.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id           INTEGER PRIMARY KEY,
+    url          TEXT UNIQUE NOT NULL,
+    title        TEXT NOT NULL,
+    source       TEXT,
+    published_at TEXT,
+    tier         INTEGER NOT NULL,
+    tags         TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS articles_published ON articles (published_at);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+    title, tags, content='articles', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+    INSERT INTO articles_fts (rowid, title, tags) VALUES (new.id, new.title, new.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+    INSERT INTO articles_fts (articles_fts, rowid, title, tags) VALUES ('delete', old.id, old.title, old.tags);
+END;
+CREATE TRIGGER IF NOT EXISTS articles_au AFTER UPDATE ON articles BEGIN
+    INSERT INTO articles_fts (articles_fts, rowid, title, tags) VALUES ('delete', old.id, old.title, old.tags);
+    INSERT INTO articles_fts (rowid, title, tags) VALUES (new.id, new.title, new.tags);
+END;
+
+CREATE TABLE IF NOT EXISTS watermarks (
+    query        TEXT NOT NULL,
+    source       TEXT NOT NULL,
+    symbol       TEXT NOT NULL,
+    company      TEXT NOT NULL,
+    published_at TEXT,
+    checked_at   REAL NOT NULL,
+    PRIMARY KEY (query, source)
+);
+
+CREATE TABLE IF NOT EXISTS queries (
+    query          TEXT PRIMARY KEY,
+    symbol         TEXT NOT NULL,
+    company        TEXT NOT NULL,
+    last_requested REAL NOT NULL
+);
+"""
+
+# Scheduled refreshes only cover queries a digest asked for this recently
+ACTIVE_QUERY_DAYS = 7
+
+
+def query_key(symbol: str, company: str) -> str:
+    return f"{symbol.strip().lower()}\0{company.strip().lower()}"
+
+
+def _phrase(text: str) -> str:
+    """Quote `text` as an FTS5 phrase."""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def match_expr(symbol: str, company: str) -> str:
+    """FTS5 equivalent of the NewsAPI `qInTitle` query `symbol OR "company"`."""
+    terms = [t for t in dict.fromkeys((symbol.strip(), company.strip())) if t]
+    return " OR ".join(_phrase(t) for t in terms)
+
+
+class NewsStore:
+    """
+    Local article store with an FTS5 index over titles (and the tags of the
+    queries that fetched them), plus a `publishedAt` watermark per query and
+    source (NewsAPI, Finnhub) so ingestion only asks each API for articles
+    newer than what it has already given us.
+
+    Opens a short-lived connection per call, so one instance can be shared
+    across Streamlit's script threads.
+    """
+
+    def __init__(self, path: str = NEWS_STORE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            with conn:
+                yield conn
+
+    def add(self, articles: list[dict], tag: str = "") -> int:
+        """
+        Insert articles (dicts with title/url/source/published_at/tier),
+        ignoring URLs already stored; `tag` is appended to existing rows so
+        they also match the query that found them. Returns rows inserted.
+        """
+        inserted = 0
+        with self._connect() as conn:
+            for a in articles:
+                if not a.get("url"):
+                    continue
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO articles (url, title, source, published_at, tier, tags) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (a["url"], a["title"], a["source"], a["published_at"], a["tier"], tag),
+                )
+                if cur.rowcount:
+                    inserted += 1
+                elif tag:
+                    conn.execute(
+                        "UPDATE articles SET tags = trim(tags || ' ' || ?) "
+                        "WHERE url = ? AND instr(' ' || tags || ' ', ' ' || ? || ' ') = 0",
+                        (tag, a["url"], tag),
+                    )
+        return inserted
+
+    def watermark(self, symbol: str, company: str, source: str) -> tuple[str | None, float] | None:
+        """
+        (latest published_at seen, last successful check time) for a query
+        from one source, or None if never fetched.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT published_at, checked_at FROM watermarks WHERE query = ? AND source = ?",
+                (query_key(symbol, company), source),
+            ).fetchone()
+
+    def set_watermark(self, symbol: str, company: str, source: str, published_at: str | None):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO watermarks (query, source, symbol, company, published_at, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (query, source) DO UPDATE SET "
+                "published_at = max(coalesce(published_at, ''), coalesce(excluded.published_at, '')), "
+                "checked_at = excluded.checked_at",
+                (query_key(symbol, company), source, symbol, company, published_at, time.time()),
+            )
+
+    def touch(self, symbol: str, company: str):
+        """Record that a digest just asked for this query."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO queries (query, symbol, company, last_requested) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (query) DO UPDATE SET last_requested = excluded.last_requested",
+                (query_key(symbol, company), symbol, company, time.time()),
+            )
+
+    def queries(self, active_days: int = ACTIVE_QUERY_DAYS) -> list[tuple[str, str]]:
+        """(symbol, company) queries requested within the last `active_days`."""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT symbol, company FROM queries WHERE last_requested >= ?",
+                (time.time() - active_days * 86400,),
+            ).fetchall()
+
+    def search(self, symbol: str, company: str, max_items: int = 5, max_age_days: int = 30) -> list[dict]:
+        """
+        Newest matching articles, high-quality domains first (tier order),
+        in the same shape get_news_for_symbol returns.
+        """
+        expr = match_expr(symbol, company)
+        if not expr:
+            return []
+        cutoff = (dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=max_age_days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT a.title, a.url, a.source FROM articles_fts f "
+                "JOIN articles a ON a.id = f.rowid "
+                "WHERE articles_fts MATCH ? AND a.published_at >= ? "
+                "ORDER BY a.tier, a.published_at DESC LIMIT ?",
+                (expr, cutoff, max_items),
+            ).fetchall()
+        return [{"title": t, "url": u, "source": s} for t, u, s in rows]
+
+    def prune(self, max_age_days: int = 45, active_days: int = ACTIVE_QUERY_DAYS) -> int:
+        """
+        Delete articles older than `max_age_days`, and forget queries (and their
+        watermarks) nobody requested within `active_days`. Returns articles deleted.
+        """
+        cutoff = (dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=max_age_days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+        idle = time.time() - active_days * 86400
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM watermarks WHERE query NOT IN "
+                "(SELECT query FROM queries WHERE last_requested >= ?)",
+                (idle,),
+            )
+            conn.execute("DELETE FROM queries WHERE last_requested < ?", (idle,))
+            return conn.execute("DELETE FROM articles WHERE published_at < ?", (cutoff,)).rowcount
@@ -11,8 +11,9 @@ from utils import to_ticker, fill_random_tickers
 from data_fetcher import fetch_index
 from quote_fetcher import get_stock_quote
 from news_scraper import get_news_for_symbol
-from chart_maker import performance_charts
-from email_sender import send_email
+from chart_maker import performance_charts, DEFAULT_SPANS
+from email_sender import send_email, build_message, message_size_report, wire_bytes
+from html_optimizer import optimize_html
 
 # Load OpenAI key from env OR Streamlit secrets
 _api_key = os.getenv("OPENAI_API_KEY", "").strip() or st.secrets["OPENAI_API_KEY"]
@@ -30,6 +31,16 @@ INDEX_DISPLAY = {
     "Australia":     "ASX 200",
 }
 
+SPAN_TITLES = {
+    "1M":  "1-Month",
+    "3M":  "3-Month",
+    "6M":  "6-Month",
+    "1Y":  "1-Year",
+    "5Y":  "5-Year",
+    "10Y": "10-Year",
+    "MAX": "All-Time",
+}
+
 # … the rest of your Streamlit UI code remains unchanged …
 
 
@@ -105,7 +116,25 @@ def generate_stock_blurb(symbol: str, company: str, analyst_rec: str, target: fl
     )
     return resp.choices[0].message.content.strip()
 
-def build_and_send(name: str, region: str, tickers: list[str], email: str):
+def build_and_send(name: str, region: str, tickers: list[str], email: str,
+                   combined_charts: bool = False, outbox=None, run_id: str | None = None,
+                   chart_spans=DEFAULT_SPANS) -> dict | None:
+    """
+    Build the personalized digest and email it. `chart_spans` picks the
+    performance chart horizons (see chart_maker.SPANS); with combined_charts=True
+    they go out as a single stacked image.
+    Returns the size report of the message.
+
+    If an `outbox.Outbox` is given, the message is queued there under
+    `run_id` (default: today's date) instead of being sent; recipients
+    already queued for that run are skipped without rebuilding, and
+    None is returned for them.
+    """
+    if outbox is not None:
+        run_id = run_id or f"{datetime.now():%Y-%m-%d}"
+        if outbox.contains(run_id, email):
+            return None
+
     # 1) Normalize & fill empty
     tickers = [to_ticker(t) for t in tickers]
     tickers = fill_random_tickers(tickers)
@@ -170,17 +199,27 @@ def build_and_send(name: str, region: str, tickers: list[str], email: str):
 
     # 6) Charts
     symbols = tickers + [idx_sym]
-    charts = performance_charts(symbols)
-    cid1, img1 = charts["1M"]
-    cid2, img2 = charts["1Y"]
-    charts_html = (
-        "<div style='text-align:center;margin:2em 0;'>"
-        "<h2 style='font-size:24px;color:#002E5D;'>1-Month Performance</h2>"
-        f"<img src='cid:{cid1}' style='max-width:100%;height:auto;'/>"
-        "<h2 style='font-size:24px;color:#002E5D;margin-top:2em;'>1-Year Performance</h2>"
-        f"<img src='cid:{cid2}' style='max-width:100%;height:auto;'/>"
-        "</div>"
-    )
+    charts = performance_charts(symbols, spans=chart_spans, combined=combined_charts)
+    chart_imgs = [img for _, img in charts.values()]
+    if combined_charts:
+        cid, _ = charts["combined"]
+        titles = " &amp; ".join(SPAN_TITLES[label] for label in chart_spans)
+        charts_html = (
+            "<div style='text-align:center;margin:2em 0;'>"
+            f"<h2 style='font-size:24px;color:#002E5D;'>{titles} Performance</h2>"
+            f"<img src='cid:{cid}' style='max-width:100%;height:auto;'/>"
+            "</div>"
+        )
+    else:
+        charts_html = "<div style='text-align:center;margin:2em 0;'>"
+        for i, label in enumerate(chart_spans):
+            cid, _ = charts[label]
+            margin = "margin-top:2em;" if i else ""
+            charts_html += (
+                f"<h2 style='font-size:24px;color:#002E5D;{margin}'>{SPAN_TITLES[label]} Performance</h2>"
+                f"<img src='cid:{cid}' style='max-width:100%;height:auto;'/>"
+            )
+        charts_html += "</div>"
 
     # 7) Weekly Top News
     weekly = get_news_for_symbol("world", "global economy", max_items=5)
@@ -253,9 +292,15 @@ def build_and_send(name: str, region: str, tickers: list[str], email: str):
     )
 
     subject = f"Financial Digest for {datetime.now():%B %d, %Y}"
-    send_email(
+    if outbox is not None:
+        msg = build_message(email, subject, optimize_html(html), chart_imgs)
+        raw = wire_bytes(msg)
+        outbox.enqueue(run_id, email, subject, raw)
+        return message_size_report(msg, raw)
+
+    return send_email(
         recipient=email,
         subject=subject,
-        html_body=html,
-        inline_images=[img1, img2]
+        html_body=optimize_html(html),
+        inline_images=chart_imgs
     )
@@ -0,0 +1,278 @@
+# outbox.py
+
+import argparse
+import hashlib
+import multiprocessing as mp
+import os
+import smtplib
+import socket
+import sqlite3
+import time
+
+from email_sender import smtp_connection, send_raw
+
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.sqlite3")
+
+# Recipients hash into this many fixed buckets; workers own `bucket % num_shards`
+NUM_BUCKETS = 1024
+# A claimed message whose lease runs out (crashed worker) becomes claimable again
+LEASE_SECONDS = 300
+MAX_ATTEMPTS = 5
+BATCH_SIZE = 20
+# A rejected message waits RETRY_BACKOFF * 2**(attempts-1) seconds before its next try
+RETRY_BACKOFF = 60
+# After a dropped connection a worker reconnects this often (with backoff), then exits
+MAX_RECONNECTS = 3
+RECONNECT_BACKOFF = 5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    msg_id      TEXT PRIMARY KEY,
+    run_id      TEXT NOT NULL,
+    recipient   TEXT NOT NULL,
+    bucket      INTEGER NOT NULL,
+    subject     TEXT,
+    raw         BLOB NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending',
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    claimed_by  TEXT,
+    lease_until REAL,
+    not_before  REAL,
+    created_at  REAL NOT NULL,
+    sent_at     REAL,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_status_bucket ON outbox (status, bucket);
+"""
+
+
+def message_id(run_id: str, recipient: str) -> str:
+    """Idempotency key: one message per recipient per run."""
+    return hashlib.sha256(f"{run_id}\0{recipient.strip().lower()}".encode()).hexdigest()
+
+
+def recipient_bucket(recipient: str) -> int:
+    digest = hashlib.sha256(recipient.strip().lower().encode()).digest()
+    return int.from_bytes(digest[:8], "big") % NUM_BUCKETS
+
+
+class Outbox:
+    """
+    Durable SQLite queue of built digest messages and their send state.
+
+    Messages move pending -> claimed -> sent (or back to pending, with
+    backoff, when a send fails, and to failed after MAX_ATTEMPTS). Claims
+    carry a lease, so rows held by a crashed worker are picked up again once
+    the lease expires, and a worker restarted under the same id takes its
+    rows back immediately.
+
+    Delivery is at-least-once: a crash between the SMTP server accepting a
+    message and mark_sent() committing will resend that one message.
+    Several nodes can share one outbox file only on a filesystem with
+    working SQLite locking; each node then runs its own --shard.
+    """
+
+    def __init__(self, path: str = OUTBOX_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def contains(self, run_id: str, recipient: str) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM outbox WHERE msg_id = ?", (message_id(run_id, recipient),)
+        ).fetchone()
+        return row is not None
+
+    def enqueue(self, run_id: str, recipient: str, subject: str, raw: bytes) -> bool:
+        """
+        Record a built message. Returns False if this run already holds a
+        message for the recipient (the existing row is left untouched).
+        """
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO outbox "
+            "(msg_id, run_id, recipient, bucket, subject, raw, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                message_id(run_id, recipient),
+                run_id,
+                recipient,
+                recipient_bucket(recipient),
+                subject,
+                raw,
+                time.time(),
+            ),
+        )
+        return cur.rowcount == 1
+
+    def release(self, worker_id: str, refund: bool = False) -> int:
+        """
+        Return every row still claimed by `worker_id` to pending. With
+        refund=True the claim doesn't count as an attempt (nothing was sent);
+        otherwise a row already on its final attempt is failed instead.
+        """
+        cur = self.conn.execute(
+            "UPDATE outbox SET "
+            "status = CASE WHEN attempts - :refund >= :max THEN 'failed' ELSE 'pending' END, "
+            "error = CASE WHEN attempts - :refund >= :max "
+            "THEN coalesce(error, 'worker stopped during final attempt') ELSE error END, "
+            "attempts = attempts - :refund, claimed_by = NULL, lease_until = NULL "
+            "WHERE status = 'claimed' AND claimed_by = :worker",
+            {"refund": 1 if refund else 0, "max": MAX_ATTEMPTS, "worker": worker_id},
+        )
+        return cur.rowcount
+
+    def claim(self, worker_id: str, shard: int = 0, num_shards: int = 1,
+              limit: int = BATCH_SIZE, lease: float = LEASE_SECONDS) -> list[tuple[str, str, bytes]]:
+        """
+        Atomically claim up to `limit` sendable messages in this shard.
+        Returns [(msg_id, recipient, raw), ...].
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            # A worker that died on a row's last attempt leaves it claimed; fail it here
+            self.conn.execute(
+                "UPDATE outbox SET status = 'failed', claimed_by = NULL, lease_until = NULL, "
+                "error = coalesce(error, 'lease expired on final attempt') "
+                "WHERE status = 'claimed' AND lease_until < ? AND attempts >= ?",
+                (now, MAX_ATTEMPTS),
+            )
+            rows = self.conn.execute(
+                "SELECT msg_id, recipient, raw FROM outbox "
+                "WHERE bucket % ? = ? AND attempts < ? "
+                "AND ((status = 'pending' AND coalesce(not_before, 0) <= ?) "
+                "OR (status = 'claimed' AND lease_until < ?)) "
+                "ORDER BY created_at LIMIT ?",
+                (num_shards, shard, MAX_ATTEMPTS, now, now, limit),
+            ).fetchall()
+            self.conn.executemany(
+                "UPDATE outbox SET status = 'claimed', claimed_by = ?, lease_until = ?, "
+                "attempts = attempts + 1 WHERE msg_id = ?",
+                [(worker_id, now + lease, r[0]) for r in rows],
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def mark_sent(self, msg_id: str, worker_id: str):
+        self.conn.execute(
+            "UPDATE outbox SET status = 'sent', sent_at = ?, lease_until = NULL, error = NULL "
+            "WHERE msg_id = ? AND claimed_by = ?",
+            (time.time(), msg_id, worker_id),
+        )
+
+    def mark_failed(self, msg_id: str, worker_id: str, error: str):
+        """Count a rejection; the row is retried after a backoff or, at MAX_ATTEMPTS, failed."""
+        self.conn.execute(
+            "UPDATE outbox SET "
+            "status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "not_before = ? + ? * (1 << (attempts - 1)), "
+            "claimed_by = NULL, lease_until = NULL, error = ? "
+            "WHERE msg_id = ? AND claimed_by = ?",
+            (MAX_ATTEMPTS, time.time(), RETRY_BACKOFF, error, msg_id, worker_id),
+        )
+
+    def counts(self) -> dict[str, int]:
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status"))
+
+
+def _is_connection_error(e: Exception) -> bool:
+    """
+    True for failures of the SMTP session itself (dropped or refused
+    connection, 421 service closing, socket errors), as opposed to the
+    server rejecting one particular message.
+    """
+    if isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code == 421
+    # SMTPException subclasses OSError; plain OSErrors are socket-level
+    return isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+
+
+def run_worker(path: str = OUTBOX_PATH, shard: int = 0, num_shards: int = 1,
+               worker_id: str | None = None) -> int:
+    """
+    Drain one shard of the outbox, reusing one SMTP session across messages.
+    Returns the number of messages sent. `worker_id` must be unique among
+    live workers, since a starting worker releases that id's claims.
+
+    Every send that fails counts against that message's attempts, including
+    one that was in flight when the session dropped, so a message that keeps
+    killing the connection ends up failed. The rest of the batch, never
+    tried, is released without using an attempt and the worker reconnects,
+    giving up after MAX_RECONNECTS.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{shard}/{num_shards}"
+    box = Outbox(path)
+    sent = 0
+    reconnects = 0
+    try:
+        # Resume: anything this worker held when it last died goes back to pending
+        box.release(worker_id)
+        batch = box.claim(worker_id, shard, num_shards)
+        while batch:
+            try:
+                with smtp_connection() as server:
+                    while batch:
+                        for msg_id, recipient, raw in batch:
+                            try:
+                                send_raw(server, recipient, raw)
+                            except Exception as e:
+                                box.mark_failed(msg_id, worker_id, str(e))
+                                if _is_connection_error(e):
+                                    raise
+                                continue
+                            box.mark_sent(msg_id, worker_id)
+                            sent += 1
+                            reconnects = 0
+                        batch = box.claim(worker_id, shard, num_shards)
+            except Exception as e:
+                box.release(worker_id, refund=True)
+                if not _is_connection_error(e):
+                    raise
+                reconnects += 1
+                if reconnects > MAX_RECONNECTS:
+                    break
+                time.sleep(RECONNECT_BACKOFF * 2 ** (reconnects - 1))
+                batch = box.claim(worker_id, shard, num_shards)
+    finally:
+        box.close()
+    return sent
+
+
+def _run_shard(args: tuple[str, int, int]) -> int:
+    return run_worker(*args)
+
+
+def run_workers(path: str = OUTBOX_PATH, num_workers: int | None = None) -> int:
+    """
+    Drain the whole outbox with one process per shard on this machine.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    with mp.Pool(num_workers) as pool:
+        return sum(pool.map(_run_shard, [(path, i, num_workers) for i in range(num_workers)]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send queued digests from the outbox.")
+    parser.add_argument("--path", default=OUTBOX_PATH)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="local worker processes (default: CPU count)")
+    parser.add_argument("--shard", type=int, default=None,
+                        help="run only this shard (for splitting across nodes)")
+    parser.add_argument("--num-shards", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.shard is not None:
+        n = run_worker(args.path, args.shard, args.num_shards)
+    else:
+        n = run_workers(args.path, args.workers)
+    print(f"sent {n} message(s)")